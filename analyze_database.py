@@ -3,206 +3,236 @@ import os
 
 import numpy as np
 import pandas as pd
-from matplotlib import pyplot as plt
 from psycopg2._psycopg import connection
 
+import query_cache
+import render
+from hll import HyperLogLog
+
 prefix = 'aar'
 
+_sketches: dict[str, dict] = {}
+
 
-def analyze_data(con: connection):
+def analyze_data(con: connection, headless=False, approx=False, cache=True):
     logging.getLogger().setLevel(logging.INFO)
+    query_cache.enabled = cache
 
     # create folder for result tsvs
     os.makedirs('results/', exist_ok=True)
-
-    # total jars, jars per year
-    # get_basic_counts(con)
-
-    # monthly
-    for year in range(2015, 2022):
-        one_year_per_month(con, year)
-
-    # get types
-    # analyze_types(con)
-    # analyze_types_by_year(con)
-
-    # get scheme counts
-    # analyze_version_schemes_raemakers_sidebyside(con)
-    # version_schemes_raemakers(con, '2002-01-01 00:00:00', '2005-01-01 00:00:00', '2002-2004')
-    # version_schemes_raemakers(con, '2005-01-01 00:00:00', '2022-01-01 00:00:00', '2005-2021')
-    # version_schemes_raemakers(con, '2022-01-01 00:00:00', '2023-01-01 00:00:00', '2022')
-    # version_schemes_raemakers(con, '2005-01-01 00:00:00', '2023-01-01 00:00:00', '2002-2022')
-    version_scheme_changes(con)
-
-    # get examples
-    logging.info(f"*** Just printing some examples ***")
-    cursor = con.cursor()
-    cursor.execute(
-        '''SELECT * FROM data 
-        WHERE id BETWEEN 200 AND 220
-        ORDER BY groupid''')
-    for row in cursor:
-        logging.debug(row)
-
-    # get most versions
-    # find_packages_with_most_versions(con, 5)
+    render.start(headless)
+    try:
+        # total jars, jars per year
+        # get_basic_counts(con, approx)
+
+        # monthly
+        for year in range(2015, 2022):
+            one_year_per_month(con, year, approx)
+
+        # get types
+        # analyze_types(con)
+        # analyze_types_by_year(con)
+
+        # get scheme counts
+        # analyze_version_schemes_raemakers_sidebyside(con)
+        # version_schemes_raemakers(con, '2002-01-01 00:00:00', '2005-01-01 00:00:00', '2002-2004')
+        # version_schemes_raemakers(con, '2005-01-01 00:00:00', '2022-01-01 00:00:00', '2005-2021')
+        # version_schemes_raemakers(con, '2022-01-01 00:00:00', '2023-01-01 00:00:00', '2022')
+        # version_schemes_raemakers(con, '2005-01-01 00:00:00', '2023-01-01 00:00:00', '2002-2022')
+        version_scheme_changes(con)
+
+        # get examples
+        logging.info(f"*** Just printing some examples ***")
+        cursor = con.cursor()
+        cursor.execute(
+            '''SELECT * FROM data 
+            WHERE id BETWEEN 200 AND 220
+            ORDER BY groupid''')
+        for row in cursor:
+            logging.debug(row)
+
+        # get most versions
+        # find_packages_with_most_versions(con, 5)
+    finally:
+        # wait for pending figures, also if a query failed
+        render.finish()
 
     # close
     con.close()
 
 
-def get_basic_counts(con: connection):
+def get_basic_counts(con: connection, approx=False):
     cursor = con.cursor()
     cursor.execute("SELECT MAX(id) FROM data")
     logging.info(f"Evaluating {cursor.fetchone()[0]} jars…")
 
     # get year counts
     logging.info(f"Evaluating {prefix}s (GAV) by year")
-    cursor.execute(
-        '''SELECT EXTRACT(YEAR FROM timestamp) AS year, COUNT(*) FROM data 
+    df = query_cache.read_sql(
+        con, '''SELECT EXTRACT(YEAR FROM timestamp) AS year, COUNT(*) FROM data 
         GROUP BY year
-        ORDER BY year ''')
-    df = pd.DataFrame(cursor, columns=['year', 'jars'])
+        ORDER BY year ''', columns=['year', 'jars'])
     logging.debug(df)
     df.to_csv(f"results/{prefix}_per_year.tsv", sep='\t')
-    df.plot(kind='bar', x='year', y='jars', title='Jars pro Jahr (alle)')
-    plt.show()
+    render.plot(df, f"{prefix}_per_year", kind='bar', x='year', y='jars', title='Jars pro Jahr (alle)')
 
     # get year counts
     logging.info(f"Evaluating libs (GA) by year")
-    cursor.execute(
-        '''SELECT year, COUNT(*) FROM (
-                         SELECT DISTINCT(groupid, artifactname) AS ga, COUNT(*), EXTRACT(YEAR from timestamp) AS year
-                         FROM data
-                         GROUP BY year, ga
-                     ) AS libs
-            GROUP BY year
-            ORDER BY year  ''')
-    df = pd.DataFrame(cursor, columns=['year', f"{prefix}s"])
+    if approx:
+        years = sorted({year for year, _, _ in load_sketches(con)})
+        df = pd.DataFrame([(year, approx_distinct_ga(con, (year, 1), (year, 12))) for year in years],
+                          columns=['year', f"{prefix}s"])
+    else:
+        df = query_cache.read_sql(
+            con, '''SELECT year, COUNT(*) FROM (
+                             SELECT DISTINCT(groupid, artifactname) AS ga, COUNT(*), EXTRACT(YEAR from timestamp) AS year
+                             FROM data
+                             GROUP BY year, ga
+                         ) AS libs
+                GROUP BY year
+                ORDER BY year  ''', columns=['year', f"{prefix}s"])
     logging.debug(df)
     df.to_tsv(f'results/{prefix}_libs_per_year.tsv', sep='\t')
-    df.plot(kind='bar', x='year', y=f"{prefix}s",
-            title='Artefakte/Libraries mit min. einer Version pro Jahr ({prefix}s)')
-    plt.show()
+    render.plot(df, f"{prefix}_libs_per_year", kind='bar', x='year', y=f"{prefix}s",
+                title='Artefakte/Libraries mit min. einer Version pro Jahr ({prefix}s)')
 
     # get year counts, only primary artifacts
     logging.info(f"Evaluating {prefix}s by year")
-    cursor.execute(
-        '''SELECT EXTRACT(YEAR FROM timestamp) AS year, COUNT(*) FROM data 
+    df = query_cache.read_sql(
+        con, '''SELECT EXTRACT(YEAR FROM timestamp) AS year, COUNT(*) FROM data 
         WHERE classifier IS NULL
         GROUP BY year
-        ORDER BY year ''')
-    df = pd.DataFrame(cursor, columns=['year', 'jars'])
+        ORDER BY year ''', columns=['year', 'jars'])
     logging.debug(df)
-    df.plot(kind='bar', x='year', y='jars', title='Jars pro Jahr (nur primäre)')
-    plt.show()
+    render.plot(df, f"{prefix}_primary_per_year", kind='bar', x='year', y='jars', title='Jars pro Jahr (nur primäre)')
 
 
-def one_year_per_month(con: connection, year: int):
-    cursor = con.cursor()
+def one_year_per_month(con: connection, year: int, approx=False):
     # get year counts
     logging.info(f"Evaluating {prefix}s by month for a fixed year")
-    cursor.execute(
-        '''
+    df = query_cache.read_sql(
+        con, '''
          SELECT COUNT(*), EXTRACT(MONTH from timestamp) AS month
          FROM data
          WHERE timestamp BETWEEN %s::timestamp AND %s::timestamp 
          AND versionscheme=2 
          AND version>'1.0.0'
          GROUP BY month
-         ORDER BY month''', (f"{year}-01-01 00:00:00", f"{year + 1}-01-01 00:00:00"))
-    df = pd.DataFrame(cursor, columns=[f"{prefix}s", 'month'])
+         ORDER BY month''', (f"{year}-01-01 00:00:00", f"{year + 1}-01-01 00:00:00"),
+        columns=[f"{prefix}s", 'month'])
     logging.debug(df)
     df.to_csv(f'results/{prefix}s_{year}.tsv', sep='\t')
     title = f'{prefix}-GAV > 1.0.0 nach Monat({year})'
-    df.plot(kind='bar', x='month', y=f"{prefix}s", title=title)
-    plt.show()
+    render.plot(df, f"{prefix}s_{year}", kind='bar', x='month', y=f"{prefix}s", title=title)
 
     # get year counts
     logging.info(f"Evaluating libs (GA) by year")
-    cursor.execute(
-        '''SELECT month, COUNT(*) FROM (
-                         SELECT DISTINCT(groupid, artifactname) AS ga, COUNT(*), EXTRACT(MONTH from timestamp) AS month
-                         FROM data
-                         WHERE timestamp BETWEEN %s::timestamp AND %s::timestamp
-                         GROUP BY month, ga
-                     )AS libs
-        GROUP BY month
-        ORDER BY month  ''', (f"{year}-01-01 00:00:00", f"{year + 1}-01-01 00:00:00"))
-    df = pd.DataFrame(cursor, columns=['month', 'libs'])
+    if approx:
+        df = pd.DataFrame([(month, approx_distinct_ga(con, (year, month), (year, month))) for month in range(1, 13)],
+                          columns=['month', 'libs'])
+    else:
+        df = query_cache.read_sql(
+            con, '''SELECT month, COUNT(*) FROM (
+                             SELECT DISTINCT(groupid, artifactname) AS ga, COUNT(*), EXTRACT(MONTH from timestamp) AS month
+                             FROM data
+                             WHERE timestamp BETWEEN %s::timestamp AND %s::timestamp
+                             GROUP BY month, ga
+                         )AS libs
+            GROUP BY month
+            ORDER BY month  ''', (f"{year}-01-01 00:00:00", f"{year + 1}-01-01 00:00:00"),
+            columns=['month', 'libs'])
     logging.debug(df)
     # df.to_csv('results/libs_per_year.tsv', sep='\t')
     title = f'{prefix}-(GA) mit min. einer Version nach Monat ({year})'
-    df.plot(kind='bar', x='month', y='libs', title=title)
-    plt.show()
+    render.plot(df, f"{prefix}_libs_{year}", kind='bar', x='month', y='libs', title=title)
+
+
+def load_sketches(con: connection) -> dict:
+    """Load the GA sketches written during import, once per database.
+    :returns HyperLogLog per (year, month, versionscheme)"""
+    dbname = con.info.dbname
+    if dbname not in _sketches:
+        cursor = con.cursor()
+        cursor.execute('''SELECT to_regclass('ga_sketches')''')
+        if cursor.fetchone()[0] is None:
+            logging.error("No GA sketches in %s, they are built during import. Re-import the lsl file (lsl-db) "
+                          "or run without --approx.", dbname)
+            raise RuntimeError(f"Table ga_sketches missing in {dbname}")
+        cursor.execute('''SELECT year, month, versionscheme, precision, sketch FROM ga_sketches''')
+        _sketches[dbname] = {(year, month, scheme): HyperLogLog.from_bytes(precision, bytes(sketch))
+                             for year, month, scheme, precision, sketch in cursor}
+        logging.debug(f"Loaded {len(_sketches[dbname])} GA sketches")
+    return _sketches[dbname]
+
+
+def approx_distinct_ga(con: connection, from_month: tuple, to_month: tuple, versionschemes=None) -> int:
+    """Estimate the number of distinct GAs (libraries) with a release in the given months by merging sketches.
+    Unlike COUNT(DISTINCT ...) this doesn't touch the data table, the standard error is about 0.4% (see hll.py).
+    :param from_month: first (year, month), inclusive
+    :param to_month: last (year, month), inclusive
+    :param versionschemes: only count releases with these version schemes, all if None"""
+    merged = None
+    for (year, month, scheme), sketch in load_sketches(con).items():
+        if from_month <= (year, month) <= to_month and (versionschemes is None or scheme in versionschemes):
+            if merged is None:
+                # the precision the sketches were built with, not necessarily the current default
+                merged = HyperLogLog(sketch.precision)
+            merged.merge(sketch)
+    return merged.count() if merged is not None else 0
 
 
 def analyze_version_schemes_raemakers_sidebyside(con: connection):
     # total jars per version scheme
     logging.info(f"Evaluating {prefix}s by version scheme")
-    cursor = con.cursor()
-    cursor.execute('''SELECT versionscheme, COUNT(*) FROM data 
-    GROUP BY versionscheme ORDER BY versionscheme''')
+    df_year = query_cache.read_sql(con, '''SELECT versionscheme, COUNT(*) FROM data 
+    GROUP BY versionscheme ORDER BY versionscheme''', columns=['scheme', f"{prefix}s"])
+    logging.debug(df_year)
     # only 2020
     logging.info(f"Evaluating {prefix}s by version scheme in 2022")
-    cursor_2020 = con.cursor()
-    cursor_2020.execute(
-        '''SELECT versionscheme, COUNT(*) FROM data 
+    df_2020 = query_cache.read_sql(
+        con, '''SELECT versionscheme, COUNT(*) FROM data 
         WHERE timestamp BETWEEN '2020-01-01 00:00:00'::timestamp AND '2020-12-31 23:59:59'::timestamp 
         GROUP BY versionscheme 
         ORDER BY versionscheme 
-        ''')
+        ''', columns=['scheme', f"{prefix}s"])
+    logging.debug(df_2020)
     labels = ['M.M', 'M.M.P', '3', 'M.M-p', 'M.M.P-p', 'other']
 
     # plot it
-    fig, (ax1, ax2) = plt.subplots(1, 2, sharey='all')
-    df_year = pd.DataFrame(cursor, columns=['scheme', f"{prefix}s"])
-    logging.debug(df_year)
-    df_year.plot(kind='bar', x='scheme', y='jars',
-                 title=f'Versionsschemata gesamt, {prefix}s', ax=ax1)
-    df_2020 = pd.DataFrame(cursor_2020, columns=['scheme', f"{prefix}s"])
-    logging.debug(df_2020)
-    df_2020.plot(kind='bar', x='scheme', y=f"{prefix}s",
-                 title=f"Versionsschemata in 2020, {prefix}s", ax=ax2)
-    plt.show()
+    render.plot_panels(f"{prefix}_version_schemes_sidebyside", [
+        (df_year, dict(kind='bar', x='scheme', y=f"{prefix}s", title=f'Versionsschemata gesamt, {prefix}s')),
+        (df_2020, dict(kind='bar', x='scheme', y=f"{prefix}s", title=f"Versionsschemata in 2020, {prefix}s"))],
+        sharey=True)
 
 
 def version_schemes_raemakers(con: connection, from_date: str, to_date: str, title: str):
     labels = ['M.M', 'M.M.P', '3', 'M.M-p', 'M.M.P-p', 'other']
     # absolut pro Jahr
     logging.info(f"Evaluating {prefix}s by version scheme and year")
-    cursor_cross = con.cursor()
-    cursor_cross.execute(
-        '''SELECT EXTRACT(YEAR FROM timestamp) AS year, versionscheme, COUNT(*) FROM data
+    df = query_cache.read_sql(
+        con, '''SELECT EXTRACT(YEAR FROM timestamp) AS year, versionscheme, COUNT(*) FROM data
         WHERE timestamp BETWEEN %s::timestamp AND %s::timestamp
         GROUP BY versionscheme, year
-        ''', (from_date, to_date))
-
-    df = pd.DataFrame(cursor_cross, columns=['year', 'scheme', 'count'])
+        ''', (from_date, to_date), columns=['year', 'scheme', 'count'])
     df_cross = pd.crosstab(index=df['year'], columns=df['scheme'], values=df['count'],
                            aggfunc=np.sum, dropna=False)
     # logging.info(df)
     logging.debug(df_cross)
-    df_cross.plot.bar(stacked=True)
-
-    plt.legend(labels=labels)
-    plt.title(f'Anzahl {prefix}s nach Versionsschema pro Jahr ({title})')
-    plt.show()
+    render.plot(df_cross, f"{prefix}_version_schemes_{title}", kind='bar', stacked=True,
+                legend=dict(labels=labels), title=f'Anzahl {prefix}s nach Versionsschema pro Jahr ({title})')
 
     # Anteile pro Jahr als Areaplot
     df_cross_n = pd.crosstab(index=df['year'], columns=df['scheme'], values=df['count'],
                              aggfunc=np.sum, dropna=False, normalize='index')
-    df_cross_n.plot.area(stacked=True)
     logging.debug(df_cross_n)
-    plt.legend(loc='center left', bbox_to_anchor=(1.0, 0.5), labels=labels)
-    plt.title(f'Anteile der Versionsschemata in {prefix}s nach Jahr ({title})')
-    plt.show()
+    render.plot(df_cross_n, f"{prefix}_version_schemes_share_area_{title}", kind='area', stacked=True,
+                legend=dict(loc='center left', bbox_to_anchor=(1.0, 0.5), labels=labels),
+                title=f'Anteile der Versionsschemata in {prefix}s nach Jahr ({title})')
 
     # Anteile pro Jahr als Lineplot
-    df_cross_n.plot.line()
-    plt.title(f'Anteile der Versionsschemata in {prefix}s nach Jahr ({title})')
-    plt.legend(loc='center left', bbox_to_anchor=(1.0, 0.5))
-    plt.show()
+    render.plot(df_cross_n, f"{prefix}_version_schemes_share_line_{title}", kind='line',
+                legend=dict(loc='center left', bbox_to_anchor=(1.0, 0.5)),
+                title=f'Anteile der Versionsschemata in {prefix}s nach Jahr ({title})')
 
 
 def analyze_version_schemes_per_artifact(con: connection):
@@ -228,13 +258,12 @@ def version_scheme_changes(con: connection):
                       ORDER BY c DESC''')
 
     # have a look at those using all schemes
-    cursor.execute('''SELECT ga FROM aggregated_ga WHERE agg_vs = ARRAY[1,2,3,4,5,6]''')
-    df = pd.DataFrame(cursor, columns=['ga'])
+    df = query_cache.read_sql(con, '''SELECT ga FROM aggregated_ga WHERE agg_vs = ARRAY[1,2,3,4,5,6]''',
+                              columns=['ga'])
     # logging.info(df)
 
     # have a look at those using just other
-    cursor.execute('''SELECT ga FROM aggregated_ga WHERE agg_vs = ARRAY[6]''')
-    df = pd.DataFrame(cursor, columns=['ga'])
+    df = query_cache.read_sql(con, '''SELECT ga FROM aggregated_ga WHERE agg_vs = ARRAY[6]''', columns=['ga'])
     logging.info(df)
     pass
 
@@ -274,38 +303,31 @@ def find_packages_with_most_versions(con: connection, n: int):
 def analyze_types(con: connection):
     """Wie viele Artefakte welchen Typs sind in der Datenbank?"""
     logging.info(f"Evaluating {prefix}s by type")
-    cursor = con.cursor()
-    cursor.execute('''SELECT classifier, COUNT(*) FROM data
+    df_type = query_cache.read_sql(con, '''SELECT classifier, COUNT(*) FROM data
                       GROUP BY classifier 
-                      ORDER BY COUNT(*) DESC''')
-    df_type = pd.DataFrame(cursor, columns=['type', f"{prefix}s"])
+                      ORDER BY COUNT(*) DESC''', columns=['type', f"{prefix}s"])
     logging.debug(df_type)
-    df_type.plot(kind='bar', x='type', y=f"{prefix}s", title="Artefakt-Typen")
-    plt.show()
+    render.plot(df_type, f"{prefix}_types", kind='bar', x='type', y=f"{prefix}s", title="Artefakt-Typen")
 
 
 def analyze_types_by_year(con: connection):
     """Wie verteilen sich die Artefakt-Typen auf die Jahre?"""
     # get type counts
     logging.info(f"Evaluating {prefix}s by year and type")
-    cursor = con.cursor()
-    cursor.execute('''SELECT EXTRACT(YEAR FROM timestamp) AS year,classifier,COUNT(*) FROM data 
+    df = query_cache.read_sql(con, '''SELECT EXTRACT(YEAR FROM timestamp) AS year,classifier,COUNT(*) FROM data 
                              GROUP BY classifier,year
                              ORDER BY COUNT(*) DESC 
-                             LIMIT 5''')
-    df = pd.DataFrame(cursor, columns=['year', 'type', 'count'])
+                             LIMIT 5''', columns=['year', 'type', 'count'])
     logging.info(df)
 
     # absolut
     df_cross = pd.crosstab(index=df['year'], columns=df['type'], values=df['count'],
                            aggfunc=np.sum, dropna=False)
     logging.debug(df_cross)
-    df_cross.plot.bar(stacked=True)
-    plt.show()
+    render.plot(df_cross, f"{prefix}_types_by_year", kind='bar', stacked=True)
 
     # normalized per rows/years
     df_cross_n = pd.crosstab(index=df['year'], columns=df['type'], values=df['count'],
                              aggfunc=np.sum, dropna=False, normalize='index')
     logging.debug(df_cross_n)
-    df_cross_n.plot.bar(stacked=True)
-    plt.show()
+    render.plot(df_cross_n, f"{prefix}_types_by_year_share", kind='bar', stacked=True)
@@ -0,0 +1,57 @@
+"""
+Benchmark the startup time of main.py per action, using `python -X importtime`.
+
+Each action is measured in a fresh interpreter that imports main.py and the modules the action loads, the
+import times of all top-level modules are summed up. Run from the repository root:
+    python benchmark_startup.py [runs]
+
+@date Oct. 2026
+"""
+import statistics
+import subprocess
+import sys
+
+# modules loaded by each action of main.py
+actions = {
+    'none': [],
+    'lsl-db': ['process_lsl'],
+    'db': ['analyze_database'],
+}
+
+
+def import_time(modules: list) -> tuple[float, int]:
+    """Import main and the given modules in a new interpreter.
+    :returns total import time in ms and number of imported modules"""
+    code = '; '.join(f"import {module}" for module in ['main'] + modules)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True)
+    if result.returncode != 0:
+        # importtime lines are noise here, show only the actual error
+        error = '\n'.join(line for line in result.stderr.splitlines() if not line.startswith('import time:'))
+        raise RuntimeError(f"Importing {', '.join(['main'] + modules)} failed:\n{error}")
+    total_us = 0
+    count = 0
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        count += 1
+        # only top-level imports, nested ones are included in their parents' cumulative time
+        if not name[1:].startswith(' '):
+            total_us += int(cumulative)
+    return total_us / 1000, count
+
+
+def benchmark(runs=5):
+    print(f"{'action':<10}{'median [ms]':>14}{'min [ms]':>12}{'modules':>10}")
+    for action, modules in actions.items():
+        times = []
+        count = 0
+        for _ in range(runs):
+            ms, count = import_time(modules)
+            times.append(ms)
+        print(f"{action:<10}{statistics.median(times):>14.1f}{min(times):>12.1f}{count:>10}")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
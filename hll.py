@@ -0,0 +1,144 @@
+"""
+HyperLogLog sketches for approximate distinct counts.
+
+With the default precision of 16 bits a sketch has 65536 one-byte registers and a standard error of about 0.41%
+(1.04 / sqrt(m)), so roughly 98% of the estimates are within 1% of the true count.
+Sketches with the same precision can be merged, the result estimates the distinct count of the union.
+Small sketches are kept sparse, so cells with few distinct values take little memory and storage.
+Flajolet et al. (2007): http://algo.inria.fr/flajolet/Publications/FlFuGaMe07.pdf
+
+The raw HyperLogLog estimate with linear counting below 2.5 m overestimates by up to 3% just above that threshold.
+count() uses the improved estimator by Ertl, which has no such bias over the whole range and needs no empirical
+correction tables.
+Ertl (2017): https://arxiv.org/abs/1702.01284
+
+@date Oct. 2026
+"""
+import hashlib
+import math
+import struct
+
+default_precision = 16
+
+
+class HyperLogLog:
+    def __init__(self, precision=default_precision, registers: bytes = None):
+        """A new sketch starts sparse, it only keeps the registers that were set. Once that takes more memory than
+        the m registers, it switches to a dense bytearray.
+        :param registers: m dense registers to start from"""
+        self.precision = precision
+        self.m = 1 << precision
+        # a dict entry costs about 100 bytes, a dense register one
+        self.max_sparse = self.m // 128
+        self.registers = None
+        self.sparse = {}
+        if registers is not None:
+            if len(registers) != self.m:
+                raise ValueError(f"Expected {self.m} registers for precision {precision}, got {len(registers)}")
+            self.registers = bytearray(registers)
+            self.sparse = None
+
+    @classmethod
+    def from_bytes(cls, precision: int, data: bytes) -> 'HyperLogLog':
+        """Read a sketch written by to_bytes."""
+        if len(data) == 1 << precision:
+            return cls(precision, data)
+        sketch = cls(precision)
+        for (entry,) in struct.iter_unpack('>I', data):
+            sketch._set(entry >> 8, entry & 0xff)
+        return sketch
+
+    def add(self, value: str):
+        """Add a value to the sketch."""
+        h = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+        index = h >> (64 - self.precision)
+        rest_bits = 64 - self.precision
+        rank = rest_bits - (h & ((1 << rest_bits) - 1)).bit_length() + 1
+        self._set(index, rank)
+
+    def _set(self, index: int, rank: int):
+        if self.sparse is None:
+            if rank > self.registers[index]:
+                self.registers[index] = rank
+        elif rank > self.sparse.get(index, 0):
+            self.sparse[index] = rank
+            if len(self.sparse) > self.max_sparse:
+                self._to_dense()
+
+    def _to_dense(self):
+        self.registers = bytearray(self.m)
+        for index, rank in self.sparse.items():
+            self.registers[index] = rank
+        self.sparse = None
+
+    def merge(self, other: 'HyperLogLog'):
+        """Merge another sketch into this one."""
+        if other.precision != self.precision:
+            raise ValueError(f"Cannot merge sketches with precision {self.precision} and {other.precision}")
+        if other.sparse is not None:
+            for index, rank in other.sparse.items():
+                self._set(index, rank)
+            return
+        if self.sparse is not None:
+            self._to_dense()
+        # bytewise max of all registers at once on big integers, ranks are below 0x80 so no byte borrows from the next
+        a = int.from_bytes(self.registers, 'little')
+        b = int.from_bytes(other.registers, 'little')
+        high = int.from_bytes(b'\x80' * self.m, 'little')
+        a_ge_b = (((a | high) - b) & high) >> 7
+        mask = a_ge_b * 0xff
+        self.registers = bytearray(((a & mask) | (b & ~mask)).to_bytes(self.m, 'little'))
+
+    def count(self) -> int:
+        """Estimate the number of distinct values added."""
+        m = self.m
+        q = 64 - self.precision
+        # histogram of register values, ranks go from 0 (empty) to q + 1
+        if self.sparse is not None:
+            counts = [0] * (q + 2)
+            for rank in self.sparse.values():
+                counts[rank] += 1
+            counts[0] = m - len(self.sparse)
+        else:
+            counts = [self.registers.count(k) for k in range(q + 2)]
+        z = m * _tau(1 - counts[q + 1] / m)
+        for k in range(q, 0, -1):
+            z = 0.5 * (z + counts[k])
+        z += m * _sigma(counts[0] / m)
+        return round(m * m / (2 * math.log(2)) / z)
+
+    def to_bytes(self) -> bytes:
+        """Dense sketches as m registers, sparse ones as 4 bytes (index << 8 | rank) per set register."""
+        if self.sparse is None:
+            return bytes(self.registers)
+        return b''.join(struct.pack('>I', index << 8 | rank) for index, rank in sorted(self.sparse.items()))
+
+
+def _sigma(x: float) -> float:
+    """Correction for empty registers, see Ertl (2017)."""
+    if x == 1:
+        return math.inf
+    y = 1
+    z = x
+    while True:
+        x *= x
+        z_old = z
+        z += x * y
+        y += y
+        if z == z_old:
+            return z
+
+
+def _tau(x: float) -> float:
+    """Correction for saturated registers, see Ertl (2017)."""
+    if x == 0 or x == 1:
+        return 0.0
+    y = 1.0
+    z = 1 - x
+    while True:
+        x = math.sqrt(x)
+        z_old = z
+        y *= 0.5
+        z -= (1 - x) ** 2 * y
+        if z == z_old:
+            return z / 3
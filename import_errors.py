@@ -0,0 +1,114 @@
+"""
+Sink for lines rejected while importing lsl files.
+
+Rejected lines are counted per category in memory and written in batches, to a csv error log and optionally to
+the table 'data_rejects' via COPY. If a listing is malformed and the error rate spikes, only a sample of the
+rejected lines is written, the counts stay exact.
+
+@date Oct. 2026
+"""
+import csv
+import io
+import logging
+from collections import Counter
+
+from psycopg2 import DatabaseError
+from psycopg2._psycopg import connection
+from psycopg2.extensions import TRANSACTION_STATUS_INERROR
+
+
+class ErrorSink:
+    def __init__(self, path: str = None, con: connection = None, batch_size=10000,
+                 window=100000, max_errors_per_window=1000, sample_rate=100):
+        """
+        :param path: csv file for rejected lines, none is written if None
+        :param con: psycopg2 connection object, rejected lines are also copied to table 'data_rejects' if given
+        :param batch_size: number of rejected lines buffered before writing
+        :param window: number of input lines over which the error rate is measured
+        :param max_errors_per_window: above this many errors in a window only a sample is written
+        :param sample_rate: while sampling, write one of this many rejected lines"""
+        self.counts = Counter()
+        self.sampled_out = 0
+        self.batch_size = batch_size
+        self.window = window
+        self.max_errors_per_window = max_errors_per_window
+        self.sample_rate = sample_rate
+        self._buffer = []
+        self._window_start = 0
+        self._window_errors = 0
+        self._file = open(path, 'w', newline='') if path is not None else None
+        self._con = con
+        if con is not None:
+            cursor = con.cursor()
+            cursor.execute('''DROP TABLE IF EXISTS data_rejects''')
+            cursor.execute('''CREATE TABLE data_rejects
+                 (category          varchar NOT NULL,
+                  path              varchar,
+                  date              varchar,
+                  detail            varchar
+                );''')
+            con.commit()
+
+    def reject(self, line_number: int, category: str, path: str, date: str, detail=''):
+        """Record a rejected line.
+        :param line_number: position of the line in the input, used to measure the error rate
+        :param category: reason for the rejection, e.g. 'regex_miss' or 'bad_size'"""
+        self.counts[category] += 1
+        if line_number - self._window_start >= self.window:
+            if self._window_errors > self.max_errors_per_window:
+                logging.warning("%d errors in the last %d lines, only every %dth was written",
+                                self._window_errors, self.window, self.sample_rate)
+            self._window_start = line_number
+            self._window_errors = 0
+        self._window_errors += 1
+        if self._window_errors > self.max_errors_per_window and self._window_errors % self.sample_rate != 0:
+            self.sampled_out += 1
+            return
+        self._buffer.append((category, _clean(path), _clean(date), _clean(detail)))
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered lines."""
+        if not self._buffer:
+            return
+        if self._file is not None:
+            csv.writer(self._file).writerows(self._buffer)
+        if self._con is not None and self._con.info.transaction_status == TRANSACTION_STATUS_INERROR:
+            # the import failed, its transaction and any rejects copied so far are rolled back anyway
+            logging.warning("Import transaction aborted, %d rejected lines not copied to data_rejects",
+                            len(self._buffer))
+        elif self._con is not None:
+            data = io.StringIO()
+            csv.writer(data).writerows(self._buffer)
+            data.seek(0)
+            # COPY runs in the transaction of the import, a failing batch of rejects must not roll back the data
+            cursor = self._con.cursor()
+            cursor.execute('''SAVEPOINT data_rejects''')
+            try:
+                cursor.copy_expert(
+                    '''COPY data_rejects (category, path, date, detail) FROM STDIN WITH (FORMAT csv)''', data)
+                cursor.execute('''RELEASE SAVEPOINT data_rejects''')
+            except DatabaseError as err:
+                cursor.execute('''ROLLBACK TO SAVEPOINT data_rejects''')
+                logging.warning("Could not copy %d rejected lines to data_rejects: %s", len(self._buffer), err)
+        self._buffer.clear()
+
+    def close(self):
+        """Flush remaining lines and close the error log. Rows copied to data_rejects are committed by the caller,
+        together with the imported data."""
+        try:
+            self.flush()
+        finally:
+            if self._file is not None:
+                self._file.close()
+
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+
+def _clean(value):
+    """Remove NUL characters and unencodable surrogates, which neither COPY nor the csv log can take."""
+    if value is None:
+        return None
+    return str(value).replace('\x00', '').encode('utf-8', 'replace').decode('utf-8')
@@ -2,24 +2,26 @@ import argparse
 import logging
 import sys
 
-import analyze_database
-import process_lsl
 from postgres_utils.connect import get_connection
 
 
-def main(filename: str, type: str, test=False, shrink=False):
+def main(filename: str, type: str, test=False, shrink=False, headless=False, approx=False,
+         rejects_table=False, cache=True):
     # load lsl to sqlite database and build index
     if test:
         con = get_connection("postgres_test.ini")
     else:
         con = get_connection("postgres.ini")
+    # heavy dependencies are imported per action, importing lsl files doesn't need pandas or matplotlib
     if type == "lsl-db":
-        process_lsl.import_lsl_to_database(filename, con, shrink)
+        import process_lsl
+        process_lsl.import_lsl_to_database(filename, con, shrink, rejects_table)
         process_lsl.build_indices(con)
         process_lsl.create_views(con)
     # analyze a database table
     elif type == "db":
-        analyze_database.analyze_data(con)
+        import analyze_database
+        analyze_database.analyze_data(con, headless, approx, cache)
     else:
         logging.critical("Please provide correct type of action")
     con.close()
@@ -36,8 +38,14 @@ if __name__ == "__main__":
     parser.add_argument('type', type=str, help='mdg or lsl')
     parser.add_argument('--shrink', action='store_true', help='If given, load only primary artifacts')
     parser.add_argument('--test', action='store_true', help='Use test database instead of data22')
+    parser.add_argument('--headless', action='store_true', help='Save plots to results/ instead of showing them')
+    parser.add_argument('--approx', action='store_true', help='Estimate distinct library counts from sketches')
+    parser.add_argument('--rejects-table', action='store_true', help='Also store rejected lines in data_rejects')
+    parser.add_argument('--no-cache', action='store_true', help='Always query the database, bypass cache/')
     args = parser.parse_args(sys.argv[1:])
 
     # let's go
     logging.debug(f"Trying to process: {args.input}")
-    main(args.input, type=args.type, test=args.test, shrink=args.shrink)
+    main(args.input, type=args.type, test=args.test, shrink=args.shrink, headless=args.headless,
+         approx=args.approx, rejects_table=args.rejects_table,
+         cache=not args.no_cache)
@@ -6,26 +6,25 @@ Tool for parsing the output of rclones (https://github.com/rclone/rclone) `lsl`
 import csv
 import logging
 import re
+import uuid
 
 from psycopg2._psycopg import connection
 from psycopg2.extras import execute_values
 
 # Types
+from hll import HyperLogLog
+from import_errors import ErrorSink
 from utils import determine_versionscheme_raemaekers
 
-# logger for import errors
-err_logger = logging.getLogger('import_err')
-## new handler to only log import errors into error log
-err_logger.handlers.clear()
-err_logger.propagate = False
+# csv log for lines that could not be imported
 error_log_path = 'log/import_errors.log'
-err_logger.addHandler(logging.FileHandler(error_log_path, mode='w'))
 
 
-def import_lsl_to_database(filename: str, con: connection, shrink=False):
+def import_lsl_to_database(filename: str, con: connection, shrink=False, rejects_table=False):
     """Read an lsl file to a given sqlite-database, table 'data'.
     :param filename: lsl file to import
-    :param con: psycopg2 connection object"""
+    :param con: psycopg2 connection object
+    :param rejects_table: also copy rejected lines to table 'data_rejects'"""
     cursor = con.cursor()
     logging.debug("Remove old data table…")
     cursor.execute('''DROP TABLE IF EXISTS data CASCADE''')
@@ -41,21 +40,82 @@ def import_lsl_to_database(filename: str, con: connection, shrink=False):
           size              double precision,
           timestamp         timestamp
         );''')
+    # no version and no sketches until the new data is committed, the old ones would describe the old data
+    invalidate_data_version(con)
+    logging.debug("Remove old ga_sketches table…")
+    cursor.execute('''DROP TABLE IF EXISTS ga_sketches''')
     con.commit()
 
     logging.info(f"Import data from: {filename}")
-    with open(filename) as f:
-        reader = csv.DictReader(f, delimiter=' ', fieldnames=['size', 'date', 'time', 'path'],
-                                skipinitialspace=True)
-        execute_values(cursor,
-                       '''INSERT INTO data 
-                       (groupid, artifactname, path, version, versionscheme, classifier, size, timestamp) 
-                       VALUES %s''', process_data(reader, shrink), page_size=500)
+    sketches = {}
+    errors = ErrorSink(error_log_path, con if rejects_table else None)
+    try:
+        with open(filename) as f:
+            reader = csv.DictReader(f, delimiter=' ', fieldnames=['size', 'date', 'time', 'path'],
+                                    skipinitialspace=True)
+            execute_values(cursor,
+                           '''INSERT INTO data 
+                           (groupid, artifactname, path, version, versionscheme, classifier, size, timestamp) 
+                           VALUES %s''', process_data(reader, shrink, sketches, errors), page_size=500)
+        store_sketches(sketches, con)
+        write_data_version(filename, con)
+    finally:
+        # write the remaining rejects to the error log even if the import fails
+        errors.close()
     con.commit()
     cursor.execute('''SELECT COUNT(*) FROM data''')
     count = cursor.fetchone()[0]
     logging.info("✅ Done importing %d rows!", count)
-    logging.info("%d errors occured, see %s", len(open(error_log_path).readlines()), error_log_path)
+    logging.info("%d errors occured, see %s", errors.total(), error_log_path)
+    for category, count in errors.counts.most_common():
+        logging.info("  %s: %d", category, count)
+    if errors.sampled_out:
+        logging.info("%d rejected lines were not written due to sampling", errors.sampled_out)
+
+
+def invalidate_data_version(con: connection):
+    """Remove the version stamp of the old data, to be committed together with dropping the data table.
+    :param con: psycopg2 connection object"""
+    cursor = con.cursor()
+    cursor.execute('''CREATE TABLE IF NOT EXISTS data_version
+         (version           varchar PRIMARY KEY,
+          filename          varchar,
+          imported          timestamp NOT NULL DEFAULT now()
+        );''')
+    cursor.execute('''DELETE FROM data_version''')
+
+
+def write_data_version(filename: str, con: connection):
+    """Stamp the freshly imported data with a new version, used to key cached analysis results.
+    To be committed together with the data.
+    :param filename: lsl file that was imported
+    :param con: psycopg2 connection object"""
+    cursor = con.cursor()
+    version = uuid.uuid4().hex
+    cursor.execute('''INSERT INTO data_version (version, filename) VALUES (%s, %s)''', (version, filename))
+    logging.info("Data version: %s", version)
+
+
+def store_sketches(sketches: dict, con: connection):
+    """Store the HyperLogLog sketches of distinct GAs built during import, table 'ga_sketches'.
+    To be committed together with the data.
+    :param sketches: HyperLogLog per (year, month, versionscheme)
+    :param con: psycopg2 connection object"""
+    cursor = con.cursor()
+    logging.debug("Create new ga_sketches table…")
+    cursor.execute('''CREATE TABLE ga_sketches
+         (year              integer NOT NULL,
+          month             integer NOT NULL,
+          versionscheme     integer NOT NULL,
+          precision         integer NOT NULL,
+          sketch            bytea NOT NULL,
+          PRIMARY KEY (year, month, versionscheme)
+        );''')
+    execute_values(cursor,
+                   '''INSERT INTO ga_sketches (year, month, versionscheme, precision, sketch) VALUES %s''',
+                   [(year, month, scheme, sketch.precision, sketch.to_bytes())
+                    for (year, month, scheme), sketch in sketches.items()], page_size=100)
+    logging.info("Stored %d GA sketches", len(sketches))
 
 
 def build_indices(con: connection):
@@ -117,15 +177,24 @@ def create_views(con: connection):
     logging.info("Done!")
 
 
-def process_data(data: csv.DictReader, shrink=False) -> tuple:
+def process_data(data: csv.DictReader, shrink=False, sketches: dict = None, errors: ErrorSink = None) -> tuple:
     """Generator function for lazy processing of lsl files.
+    :param sketches: if given, filled with a HyperLogLog of distinct GAs per (year, month, versionscheme)
+    :param errors: sink for rejected lines, if None they are only counted
     :yields one GAV at a time as tuple """
+    if errors is None:
+        errors = ErrorSink()
     i = 0
-    errorcount = 0
-    for line in data:
+    for n, line in enumerate(data):
+        # stitch together timestamp
+        isodate = f"{line['date']} {line['time']}"
         try:
-            # stitch together timestamp
-            isodate = f"{line['date']} {line['time']}"
+            # a size postgres can't convert would abort the whole page of inserts
+            try:
+                float(line['size'])
+            except (TypeError, ValueError):
+                errors.reject(n, 'bad_size', line['path'], isodate, line['size'])
+                continue
 
             # split the path
             result = re.match(r"^(?P<group>.*)/(?P<artifact>[^/]+?)(?:_(?P<artifactsuffix>[\-_\.\d]+))?/"
@@ -133,7 +202,7 @@ def process_data(data: csv.DictReader, shrink=False) -> tuple:
                               line['path'])
 
             if not result:
-                err_logger.error("%s, %s", line['path'], isodate)
+                errors.reject(n, 'regex_miss', line['path'], isodate)
                 continue
 
             groupid = result.group("group")
@@ -151,6 +220,12 @@ def process_data(data: csv.DictReader, shrink=False) -> tuple:
             # convert groupid
             groupid_clean = groupid.replace('/', '.')
 
+            if sketches is not None:
+                cell = (int(line['date'][:4]), int(line['date'][5:7]), scheme)
+                if cell not in sketches:
+                    sketches[cell] = HyperLogLog()
+                sketches[cell].add(f"{groupid_clean}:{artifactname}")
+
             i += 1
             if i % 1000000 == 0:
                 logging.debug("Lines processed: %d", i)
@@ -158,5 +233,4 @@ def process_data(data: csv.DictReader, shrink=False) -> tuple:
             yield entry
 
         except ValueError as err:
-            errorcount += 1
-            logging.error(f"ValueError {errorcount}: {err}\n {line}")
+            errors.reject(n, 'value_error', line['path'], isodate, str(err))
@@ -0,0 +1,115 @@
+"""
+On-disk cache for the results of analysis queries.
+
+Results are stored as feather files, keyed by the SQL text, its parameters and the data version written by the
+importer (table 'data_version'). A new import changes the version, which drops all cached results of the old one.
+The cache is bounded in size, the least recently used files are evicted first. Set `enabled` to False to bypass it.
+
+@date Oct. 2026
+"""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+from psycopg2._psycopg import connection
+
+enabled = True
+cache_dir = 'cache/'
+max_cache_bytes = 512 * 1024 ** 2
+
+_versions: dict[str, str] = {}
+
+
+def data_version(con: connection) -> str:
+    """Return the version stamp of the current import, cached per database for the lifetime of the process."""
+    dbname = con.info.dbname
+    if dbname not in _versions:
+        cursor = con.cursor()
+        cursor.execute('''SELECT to_regclass('data_version')''')
+        version = None
+        if cursor.fetchone()[0] is not None:
+            cursor.execute('''SELECT version FROM data_version ORDER BY imported DESC LIMIT 1''')
+            row = cursor.fetchone()
+            version = row[0] if row else None
+        _versions[dbname] = version
+        logging.debug(f"Data version of {dbname}: {version}")
+    return _versions[dbname]
+
+
+def read_sql(con: connection, sql: str, params=None, columns=None) -> pd.DataFrame:
+    """Run a query and return the result as DataFrame, served from the cache if the data did not change.
+    :param con: psycopg2 connection object
+    :param sql: query text
+    :param params: query parameters
+    :param columns: column names of the resulting DataFrame"""
+    if not enabled:
+        return _query(con, sql, params, columns)
+    version = data_version(con)
+    if version is None:
+        # import in progress, failed or done without a version stamp, nothing to key the cache on
+        return _query(con, sql, params, columns)
+
+    version_dir = os.path.join(cache_dir, con.info.dbname, version)
+    _drop_old_versions(os.path.dirname(version_dir), version)
+    key = hashlib.sha256(repr((sql, params, columns)).encode()).hexdigest()
+    path = os.path.join(version_dir, f"{key}.feather")
+
+    if os.path.exists(path):
+        try:
+            df = pd.read_feather(path)
+            logging.debug(f"Cache hit: {path}")
+            os.utime(path)
+            return df
+        except Exception as err:
+            logging.warning(f"Ignoring unreadable cache file {path}: {err}")
+            os.remove(path)
+
+    df = _query(con, sql, params, columns)
+    os.makedirs(version_dir, exist_ok=True)
+    # write to a temporary file first, an interrupted write must not leave a truncated result behind
+    fd, tmp_path = tempfile.mkstemp(dir=version_dir, suffix='.tmp')
+    os.close(fd)
+    try:
+        df.to_feather(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    _evict()
+    return df
+
+
+def _query(con: connection, sql: str, params, columns) -> pd.DataFrame:
+    cursor = con.cursor()
+    cursor.execute(sql, params)
+    return pd.DataFrame(cursor, columns=columns)
+
+
+def _drop_old_versions(db_dir: str, version: str):
+    """Remove cached results of previous imports."""
+    if not os.path.isdir(db_dir):
+        return
+    for entry in os.listdir(db_dir):
+        if entry != version:
+            logging.info(f"Dropping cached results of data version {entry}")
+            shutil.rmtree(os.path.join(db_dir, entry), ignore_errors=True)
+
+
+def _evict():
+    """Delete least recently used results until the cache fits into max_cache_bytes."""
+    files = []
+    for root, _, names in os.walk(cache_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_cache_bytes:
+            break
+        logging.debug(f"Evicting {path}")
+        os.remove(path)
+        total -= size
@@ -0,0 +1,91 @@
+"""
+Plot rendering for the database analysis.
+
+Interactive runs show every figure in a window as before. Headless runs use the Agg backend and write each
+figure to `results/` as PNG and SVG; the rendering happens in a process pool, so the analysis can keep
+querying the database while earlier figures are still being drawn.
+
+@date Oct. 2026
+"""
+import logging
+import os
+import re
+from concurrent.futures import Future, ProcessPoolExecutor
+
+results_dir = 'results/'
+formats = ('png', 'svg')
+
+_executor = None
+_futures: list[tuple[str, Future]] = []
+
+
+def start(headless: bool, workers=None):
+    """Switch to headless rendering. Without calling this (or with headless=False) figures are shown interactively.
+    :param headless: render to files in a process pool instead of showing windows
+    :param workers: size of the process pool, defaults to the number of cpus"""
+    global _executor
+    if headless and _executor is None:
+        os.makedirs(results_dir, exist_ok=True)
+        _executor = ProcessPoolExecutor(max_workers=workers)
+        logging.info("Rendering plots headless to %s", results_dir)
+
+
+def finish():
+    """Wait for all pending figures and shut down the process pool."""
+    global _executor
+    for name, future in _futures:
+        try:
+            future.result()
+        except Exception as err:
+            logging.error(f"Rendering {name} failed: {err}")
+    _futures.clear()
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+
+def plot(df, name: str, title=None, legend=None, **kwargs):
+    """Plot a single DataFrame, arguments are passed on to `DataFrame.plot`.
+    :param df: data to plot
+    :param name: file name of the figure in headless mode, without extension
+    :param title: axes title
+    :param legend: keyword arguments for `Axes.legend`"""
+    plot_panels(name, [(df, kwargs)], title=title, legend=legend)
+
+
+def plot_panels(name: str, panels: list, title=None, legend=None, sharey=False):
+    """Plot several DataFrames side by side.
+    :param name: file name of the figure in headless mode, without extension
+    :param panels: list of (DataFrame, keyword arguments for `DataFrame.plot`)
+    :param title: title of the last axes
+    :param legend: keyword arguments for `Axes.legend` of the last axes
+    :param sharey: share the y-axis between panels"""
+    name = re.sub(r'[^\w\-.]+', '_', name)
+    if _executor is None:
+        _render(name, panels, title, legend, sharey, headless=False)
+    else:
+        _futures.append((name, _executor.submit(_render, name, panels, title, legend, sharey, headless=True)))
+
+
+def _render(name: str, panels: list, title, legend, sharey: bool, headless: bool):
+    """Draw the figure and either show it or save it in all formats. Runs inside a pool worker when headless."""
+    import matplotlib
+    if headless:
+        matplotlib.use('Agg')
+    from matplotlib import pyplot as plt
+
+    fig, axes = plt.subplots(1, len(panels), sharey=sharey, squeeze=False)
+    for ax, (df, kwargs) in zip(axes[0], panels):
+        df.plot(ax=ax, **kwargs)
+    ax = axes[0][-1]
+    if legend is not None:
+        ax.legend(**legend)
+    if title is not None:
+        ax.set_title(title)
+
+    if headless:
+        for fmt in formats:
+            fig.savefig(os.path.join(results_dir, f"{name}.{fmt}"), format=fmt, bbox_inches='tight')
+        plt.close(fig)
+    else:
+        plt.show()
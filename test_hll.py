@@ -0,0 +1,74 @@
+"""Tests for the HyperLogLog sketches, run with `python -m unittest test_hll`"""
+import math
+import unittest
+
+from hll import HyperLogLog, default_precision
+
+
+def filled(n: int, precision=default_precision, prefix='ga') -> HyperLogLog:
+    sketch = HyperLogLog(precision)
+    for i in range(n):
+        sketch.add(f"{prefix}{i}:artifact{i}")
+    return sketch
+
+
+class TestHyperLogLog(unittest.TestCase):
+    def test_empty(self):
+        self.assertEqual(HyperLogLog().count(), 0)
+
+    def test_small_counts(self):
+        self.assertAlmostEqual(filled(100).count(), 100, delta=2)
+
+    def test_no_bias_around_linear_counting_threshold(self):
+        """The raw estimate overestimated by 2-3% just above 2.5 m, check the mean error over several sketches."""
+        precision = 14
+        m = 1 << precision
+        for n in (round(2.5 * m), 5 * m):
+            errors = [filled(n, precision, prefix=f"t{trial}:").count() / n - 1 for trial in range(8)]
+            with self.subTest(n=n):
+                self.assertLess(abs(sum(errors) / len(errors)), 0.01)
+                # four standard errors for a single sketch
+                self.assertLess(max(map(abs, errors)), 4 * 1.04 / math.sqrt(m))
+
+    def test_default_precision_within_one_percent(self):
+        m = 1 << default_precision
+        for n in (round(2.5 * m), 5 * m):
+            with self.subTest(n=n):
+                self.assertLess(abs(filled(n).count() / n - 1), 0.01)
+
+    def test_merge_is_union(self):
+        n = 50000
+        a = filled(n, prefix='a')
+        b = filled(n, prefix='b')
+        a.merge(filled(n // 2, prefix='b'))
+        a.merge(b)
+        self.assertLess(abs(a.count() / (2 * n) - 1), 0.01)
+
+    def test_merge_rejects_other_precision(self):
+        with self.assertRaises(ValueError):
+            HyperLogLog(14).merge(HyperLogLog(16))
+
+    def test_roundtrip_bytes(self):
+        for n in (10, 100000):
+            sketch = filled(n)
+            with self.subTest(n=n, sparse=sketch.sparse is not None):
+                restored = HyperLogLog.from_bytes(sketch.precision, sketch.to_bytes())
+                self.assertEqual(restored.count(), sketch.count())
+
+    def test_sparse_until_dense_is_smaller(self):
+        sketch = filled(100)
+        self.assertIsNotNone(sketch.sparse)
+        self.assertEqual(len(sketch.to_bytes()), 4 * len(sketch.sparse))
+        sketch = filled(10000)
+        self.assertIsNone(sketch.sparse)
+
+    def test_merge_sparse_and_dense(self):
+        for a, b in ((100, 100), (100, 50000), (50000, 100)):
+            with self.subTest(a=a, b=b):
+                merged = filled(a, prefix='a')
+                merged.merge(filled(b, prefix='b'))
+                self.assertLess(abs(merged.count() / (a + b) - 1), 0.02)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+"""Tests for the import error sink, run with `python -m unittest test_import_errors`"""
+import csv
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from import_errors import ErrorSink
+
+
+class TestErrorSink(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def rows(self) -> list:
+        with open(self.path, newline='') as f:
+            return list(csv.reader(f))
+
+    def test_counts_per_category(self):
+        sink = ErrorSink()
+        for n in range(5):
+            sink.reject(n, 'regex_miss', f"path{n}", '2021-03-01 10:00:00')
+        sink.reject(5, 'bad_size', 'path5', '2021-03-01 10:00:00', 'xx')
+        sink.close()
+        self.assertEqual(sink.counts, {'regex_miss': 5, 'bad_size': 1})
+        self.assertEqual(sink.total(), 6)
+        self.assertEqual(sink.sampled_out, 0)
+
+    def test_sampling_keeps_counts_exact(self):
+        sink = ErrorSink(self.path, window=1000, max_errors_per_window=10, sample_rate=5)
+        # every line of the first window is an error
+        for n in range(100):
+            sink.reject(n, 'regex_miss', f"path{n}", '2021-03-01 10:00:00')
+        sink.close()
+        # the first 10 errors are written, then errors 15, 20, ..., 100
+        self.assertEqual(sink.total(), 100)
+        self.assertEqual(sink.sampled_out, 100 - 10 - 18)
+        self.assertEqual(len(self.rows()), 28)
+
+    def test_sampling_stops_in_next_window(self):
+        sink = ErrorSink(self.path, window=100, max_errors_per_window=10, sample_rate=5)
+        for n in range(20):
+            sink.reject(n, 'regex_miss', f"path{n}", '2021-03-01 10:00:00')
+        for n in range(100, 110):
+            sink.reject(n, 'regex_miss', f"path{n}", '2021-03-01 10:00:00')
+        sink.close()
+        # 10 + 2 sampled in the first window, all 10 in the second
+        self.assertEqual(sink.sampled_out, 8)
+        self.assertEqual(len(self.rows()), 22)
+
+    def test_writes_in_batches(self):
+        sink = ErrorSink(self.path, batch_size=4)
+        with mock.patch.object(sink, 'flush', wraps=sink.flush) as flush:
+            for n in range(10):
+                sink.reject(n, 'regex_miss', f"path{n}", '2021-03-01 10:00:00')
+            self.assertEqual(flush.call_count, 2)
+            sink.close()
+            self.assertEqual(flush.call_count, 3)
+        self.assertEqual([row[1] for row in self.rows()], [f"path{n}" for n in range(10)])
+
+    def test_removes_nul(self):
+        sink = ErrorSink(self.path)
+        sink.reject(0, 'regex_miss', 'gar\x00bage', '2021-03-01 10:00:00')
+        sink.close()
+        self.assertEqual(self.rows(), [['regex_miss', 'garbage', '2021-03-01 10:00:00', '']])
+
+
+if __name__ == '__main__':
+    unittest.main()